@@ -17,10 +17,10 @@ class Simulator:
         self.platform = self.build_platform()
         #print(self.platform.pstr("  "))
         self.workload = None
+        self.simulation_time = 0
         self.workload_manager = self.build_workload_manager()
         # TODO
         # self.statistics = Statistics(options)
-        self.simulation_time = 0
         self.energy = 0
         self.logger = logging.getLogger("simulator")
 
@@ -174,16 +174,17 @@ class Simulator:
 
         self.load_workload()
 
+        jobs = self.workload['jobs']
         job_limits = {
-            'max_time': numpy.percentile(numpy.array(
-                [from_profile('req_time',job,self.workload) for job in self.workload['jobs']]), 99),
-            'max_core': numpy.percentile(numpy.array(
+            'max_time': numpy.percentile(numpy.fromiter(
+                (from_profile('req_time',job,self.workload) for job in jobs), dtype=float, count=len(jobs)), 99),
+            'max_core': numpy.percentile(numpy.fromiter(
                 #TODO: Repensar en relacion a ntasks y ntasks-per-node. A lo mejor deberia llamarse max_tasks
-                [ntasks(job) for job in self.workload['jobs']]), 99),
-            'max_mem': numpy.percentile(numpy.array(
-                [from_profile('mem',job,self.workload) for job in self.workload['jobs']]), 99),
-            'max_mem_vol': numpy.percentile(numpy.array(
-                [from_profile('mem_vol',job,self.workload) for job in self.workload['jobs']]), 99)
+                (ntasks(job) for job in jobs), dtype=float, count=len(jobs)), 99),
+            'max_mem': numpy.percentile(numpy.fromiter(
+                (from_profile('mem',job,self.workload) for job in jobs), dtype=float, count=len(jobs)), 99),
+            'max_mem_vol': numpy.percentile(numpy.fromiter(
+                (from_profile('mem_vol',job,self.workload) for job in jobs), dtype=float, count=len(jobs)), 99)
         }
 
         return job_limits
@@ -9,6 +9,7 @@ class Node (BasicNode):
         super(Node, self).__init__(id=id, config=config)
         self.current_memory = 0
         self.core_count = 0
+        self.busy_count = 0
 
     def add_child(self, child: BasicProcessor):
         super().add_child(child)
@@ -18,17 +19,19 @@ class Node (BasicNode):
         return [ core for processor in self.children for core in processor.children ]
 
     def count_idle_cores(self):
-        return len([ 1 for core in self.cores() if core.task is None ])
+        return self.core_count - self.busy_count
 
     def max_power_consumption(self):
         return sum([ processor.max_power_consumption for processor in self.children ])
 
     def schedule(self, task: Task, resource_id: list):
         super().schedule(task, resource_id)
+        self.busy_count += 1
         self.current_memory += task.job.memory
 
     def reap(self, task: Task, resource_id: list):
         super().reap(task, resource_id)
+        self.busy_count -= 1
         self.current_memory -= task.job.memory
 
     @classmethod
@@ -11,6 +11,7 @@ class Processor (BasicProcessor):
         self.requested_memory_bandwidth = 0.0
         self.power_consumption = 0.0
         self.max_power_consumption = 0.0
+        self.busy_count = 0
         self.update_power()
 
     def add_child(self, child: BasicCore):
@@ -19,6 +20,7 @@ class Processor (BasicProcessor):
 
     def schedule(self, task: Task, resource_id: list):
         super().schedule(task, resource_id)
+        self.busy_count += 1
         self.update_speedup()
         self.update_power()
 
@@ -27,6 +29,7 @@ class Processor (BasicProcessor):
 
     def reap(self, task: Task, resource_id: list):
         super().reap(task, resource_id)
+        self.busy_count -= 1
         self.update_speedup()
         self.update_power()
 
@@ -67,8 +70,7 @@ class Processor (BasicProcessor):
                 core.speedup = 1
 
     def update_power(self):
-        task_count = sum([1 for core in self.children if core.task is not None])
-        if task_count == 0:
+        if self.busy_count == 0:
             self.power_consumption = sum([(core.min_power*core.static_power) for core in self.children])
         else:
             self.power_consumption = (sum([core.dynamic_power for core in self.children if core.task is not None]) +
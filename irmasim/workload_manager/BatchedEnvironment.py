@@ -0,0 +1,54 @@
+"""
+Batched observation of several environments, such as those of parallel training simulations.
+"""
+
+import numpy as np
+from irmasim.workload_manager.Environment import JOB_OBSERVATION_SIZE, batch_obs_kernel
+
+
+class BatchedEnvironment:
+    """Observes a group of environments at once.
+
+The pending job requirements of every environment are stacked into a single
+(environments, 4, max_pending) array, and the percentiles of all of them are computed by one
+compiled kernel call. Node observations are still gathered environment by environment. All the
+environments must share the same observation type and platform, so that their observations can be
+stacked.
+
+Attributes:
+    environments (list):
+        The batched environments.
+    observation_size (int):
+        Size of the observation of each environment.
+    """
+
+    def __init__(self, environments: list) -> None:
+        self.environments = environments
+        if any(environment.observation_type == 'jaime' for environment in environments):
+            raise Exception("Batched environments do not support the 'jaime' observation")
+        sizes = {environment.observation_size for environment in environments}
+        if len(sizes) != 1:
+            raise Exception(f"Batched environments must have the same observation size, got {sorted(sizes)}")
+        self.observation_size = sizes.pop()
+        self.inv_maxes = np.stack([environment.inv_maxes for environment in environments])
+        self.queue_sensitivities = np.array([environment.queue_sensitivity for environment in environments])
+        self.inv_two_qss = np.array([environment.inv_two_qs for environment in environments])
+
+    def observation(self) -> np.ndarray:
+        """Returns the observations of all the environments, one per row."""
+        environments = self.environments
+        counts = np.fromiter((environment.workload_manager.pending_count for environment in environments),
+                             dtype=np.int64, count=len(environments))
+        stacked = np.empty((len(environments), 4, max(counts.max(initial=0), 1)), dtype=np.float64)
+        for e, environment in enumerate(environments):
+            stacked[e, :, :counts[e]] = environment.workload_manager.pending_requirements[:, :counts[e]]
+        last_counts = np.fromiter((environment.last_job_queue_length or 0 for environment in environments),
+                                  dtype=np.int64, count=len(environments))
+
+        observations = np.empty((len(environments), self.observation_size), dtype=np.float32)
+        batch_obs_kernel(stacked, counts, self.inv_maxes, last_counts, self.queue_sensitivities, self.inv_two_qss,
+                         observations[:, -JOB_OBSERVATION_SIZE:])
+        for e, environment in enumerate(environments):
+            observations[e, :-JOB_OBSERVATION_SIZE] = environment.node_observation()
+            environment.last_job_queue_length = int(counts[e])
+        return observations
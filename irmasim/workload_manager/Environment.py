@@ -2,11 +2,11 @@
 The environment is the representation of the agent's observable context.
 """
 
-from collections import OrderedDict
-from functools import partial
+from enum import IntEnum
 import gym
 import gym.spaces
 import numpy as np
+from numba import njit
 from typing import TYPE_CHECKING
 import importlib
 
@@ -15,6 +15,30 @@ if TYPE_CHECKING:
 from irmasim.Simulator import Simulator
 from irmasim.Options import Options
 
+# Five percentiles of the four pending job requirements plus the queue variation ratio
+JOB_OBSERVATION_SIZE = 4 * 5 + 1
+
+# Observation spaces shared by all the environments with the same observation size
+_observation_spaces = {}
+
+
+class JobSelection(IntEnum):
+    RANDM = 0
+    FIARR = 1
+    SHORT = 2
+    SMALL = 3
+    LRMEM = 4
+    LRMBW = 5
+
+
+class CoreSelection(IntEnum):
+    RANDM = 0
+    HICOM = 1
+    HICOR = 2
+    HIMEM = 3
+    HIMBW = 4
+    LPOWR = 5
+
 
 class Environment(gym.Env):
     """Environment for workload management in HDeepRM.
@@ -87,9 +111,9 @@ Attributes:
         Reference to HDeepRM workload manager required to schedule the jobs on the decision step.
     action_space (gym.spaces.Discrete):
         The action space described above. See `Spaces <https://gym.openai.com/docs/#spaces>`_.
-    action_keys (list):
-        List of sorting key pairs indexed by action IDs. Keys are applied to the job scheduler and
-        the resource manager selections.
+    actions (list):
+        Job and core selection codes followed by their names, indexed by action IDs. The workload
+        manager dispatches the codes to the job scheduler and the resource manager selections.
     observation_space (gym.spaces.Box):
         The observation space described above. See `Spaces <https://gym.openai.com/docs/#spaces>`_.
     reward (function):
@@ -99,8 +123,15 @@ Attributes:
         larger variations will be noticed, however smaller ones will not have significant impact.
         If sensitivity is low, smaller variations will be noticed and large ones will be clipped,
         thus impactless.
+    inv_two_qs (float):
+        Reciprocal of twice the queue sensitivity, used to map the variation ratio to [0, 1].
+    inv_maxes (:class:`~numpy.ndarray`):
+        Reciprocals of the workload limits of the requested time, tasks, memory and memory volume.
+        Job requirements are normalised by multiplying with them.
     last_job_queue_length (int):
         Last value of the job queue length. Used for calculating the variation ratio.
+    observation_type (str):
+        Layout of the observation: 'normal', 'small', 'minimal' or 'jaime'.
     """
 
     def __init__(self, workload_manager: 'Policy', simulator: Simulator) -> None:
@@ -109,23 +140,23 @@ Attributes:
         self.env_options = Options().get()["workload_manager"]["environment"]
         self.last_job_queue_length = None
 
-        self.job_selections = OrderedDict({
-            'random': None,
-            'first': lambda job: job.submit_time,
-            'shortest': lambda job: job.req_time,
-            'smallest': lambda job: job.resources,
-            'low_mem': lambda job: job.memory,
-            'low_mem_ops': lambda job: job.memory_vol
-        })
-
-        self.core_selections = OrderedDict({
-            'random': None,
-            'high_gflops': lambda core: - core.parent.mops_per_core,
-            'high_cores': lambda core: - core.parent.parent.count_idle_cores(),
-            'high_mem': lambda core: - core.parent.parent.current_memory,
-            'high_mem_bw': lambda core: core.parent.requested_memory_bandwidth,
-            'low_power': lambda core: core.static_power + core.dynamic_power
-        })
+        self.job_selections = {
+            'random': JobSelection.RANDM,
+            'first': JobSelection.FIARR,
+            'shortest': JobSelection.SHORT,
+            'smallest': JobSelection.SMALL,
+            'low_mem': JobSelection.LRMEM,
+            'low_mem_ops': JobSelection.LRMBW
+        }
+
+        self.core_selections = {
+            'random': CoreSelection.RANDM,
+            'high_gflops': CoreSelection.HICOM,
+            'high_cores': CoreSelection.HICOR,
+            'high_mem': CoreSelection.HIMEM,
+            'high_mem_bw': CoreSelection.HIMBW,
+            'low_power': CoreSelection.LPOWR
+        }
 
         self.actions = []
         if 'actions' in self.env_options:
@@ -133,12 +164,12 @@ Attributes:
                 for job_sel, core_sels in sel.items():
                     for core_sel in core_sels:
                         self.actions.append(
-                            (self.job_selections[job_sel], self.core_selections[core_sel], job_sel, core_sel)
+                            (int(self.job_selections[job_sel]), int(self.core_selections[core_sel]), job_sel, core_sel)
                         )
         else:
             for job_sel in self.job_selections.keys():
                 for core_sel in self.core_selections.keys():
-                    self.actions.append((self.job_selections[job_sel], self.core_selections[core_sel], job_sel, core_sel))
+                    self.actions.append((int(self.job_selections[job_sel]), int(self.core_selections[core_sel]), job_sel, core_sel))
 
         nb_actions = len(self.actions)
         self.action_space = gym.spaces.Discrete(nb_actions)
@@ -149,20 +180,26 @@ Attributes:
         klass = getattr(mod, 'Node')
         self.resources = self.simulator.get_resources(klass)
 
-        if 'observation' in self.env_options:
-            if self.env_options['observation'] == 'jaime':
-                self.observation = self.observation_jaime
-            else:
-                self.observation = partial(self._base_observation, otype=self.env_options['observation'])
+        self.observation_type = self.env_options.get('observation', 'minimal')
+        if self.observation_type == 'jaime':
+            self.observation = self.observation_jaime
+            observation_size = self.observation().size
         else:
-            self.observation = partial(self._base_observation, otype='minimal')
-
-        observation_size = self.observation().size
-        self.observation_space = gym.spaces.Box(
-        low=np.zeros(observation_size, dtype=np.float32),
-        high=np.ones(observation_size, dtype=np.float32),
-        dtype=np.float32
-        )
+            observations = {
+                'minimal': self._obs_minimal,
+                'small': self._obs_small
+            }
+            self.observation = observations.get(self.observation_type, self._obs_normal)
+            observation_size = self._base_observation_size(self.observation_type)
+            # Node observations fill the start of the buffer and job statistics the end
+            self._obs_buf = np.empty(observation_size, dtype=np.float32)
+            self._job_obs_buf = self._obs_buf[observation_size - JOB_OBSERVATION_SIZE:]
+
+        if observation_size not in _observation_spaces:
+            _observation_spaces[observation_size] = gym.spaces.Box(
+                low=0.0, high=1.0, shape=(observation_size,), dtype=np.float32
+            )
+        self.observation_space = _observation_spaces[observation_size]
 
         objective_to_reward = {
             'makespan': self.makespan_reward,
@@ -177,6 +214,11 @@ Attributes:
             raise Exception(f"Unknown objective {self.env_options['objective']}. Must be one of: {objectives}.")
         self.reward = objective_to_reward[self.env_options['objective']]
         self.queue_sensitivity = self.env_options['queue_sensitivity']
+        self.inv_two_qs = 1.0 / (2 * self.queue_sensitivity)
+        # Job requirements are normalised by multiplying with the reciprocal of the workload limits
+        job_limits = self.simulator.get_workload_limits()
+        self.inv_maxes = 1.0 / np.array([job_limits['max_time'], job_limits['max_core'],
+                                         job_limits['max_mem'], job_limits['max_mem_vol']], dtype=np.float32)
         self.last_job_queue_length = 0
 
     @property
@@ -187,67 +229,75 @@ Attributes:
     def observation_size(self):
         return self.observation_space.shape[0]
 
-    def _base_observation(self, otype: str):
-        def to_range(variation_ratio: float):
-            variation_ratio = (variation_ratio + self.queue_sensitivity) \
-                              / (2 * self.queue_sensitivity)
-            return max(0.0, min(1.0, variation_ratio))
-
-        observation = []
+    def _obs_minimal(self):
+        return self._job_observation()
+
+    def _obs_small(self):
+        self._obs_buf[:-JOB_OBSERVATION_SIZE] = self._small_node_observation()
+        return self._job_observation()
+
+    def _obs_normal(self):
+        self._obs_buf[:-JOB_OBSERVATION_SIZE] = self._normal_node_observation()
+        return self._job_observation()
+
+    def _job_observation(self) -> np.ndarray:
+        """Fills the job statistics of the observation buffer and returns a copy of the buffer."""
+        workload_manager = self.workload_manager
+        pending_count = workload_manager.pending_count
+        job_obs_buf = self._job_obs_buf
+        if pending_count == 0:
+            job_obs_buf[:-1] = 0.0
+            # The variation ratio is 1 whenever the queue is or was empty
+            job_obs_buf[-1] = 1.0
+        else:
+            _obs_kernel(workload_manager.pending_requirements[:, :pending_count], self.inv_maxes,
+                        job_obs_buf, self.last_job_queue_length or 0, self.queue_sensitivity,
+                        self.inv_two_qs)
+        self.last_job_queue_length = pending_count
+        # Agents keep the observation alive until the end of the simulation, never hand out the buffer
+        return self._obs_buf.copy()
+
+    def node_observation(self) -> list:
+        """Node part of the observation, empty for the 'minimal' observation."""
+        if self.observation_type == 'minimal':
+            return []
+        if self.observation_type == 'small':
+            return self._small_node_observation()
+        return self._normal_node_observation()
+
+    def _base_observation_size(self, otype: str) -> int:
+        size = JOB_OBSERVATION_SIZE
         if otype != 'minimal':
             for cluster in self.simulator.platform.children:
                 for node in cluster.children:
-                    node_observation = []
-                    # TODO consider normalising to node total memory
-                    node_observation.append(node.current_memory)
-                    node_observation.extend(normalise([max(processor.requested_memory_bandwidth,0.0) for processor in node.children]))
-
+                    size += 1 + len(node.children)
                     if otype != 'small':
-                        for processor in node.children:
-                            node_observation.append(processor.power_consumption/processor.max_power_consumption)
-                            for core in processor.children:
-                                node_observation.append(core.speedup)
-                                #node_observation.append(core.state.current_power / (core.static_power+core.dynamic_power)) # fraction of power consumption
-                                node_observation.append(core.get_remaining_fraction())
-                    observation.extend(node_observation)
-        req_time = np.array(
-            [job.req_time for job in self.workload_manager.pending_jobs])
-        req_core = np.array(
-            [job.ntasks for job in self.workload_manager.pending_jobs])
-        req_mem = np.array(
-            [job.memory for job in self.workload_manager.pending_jobs])
-        req_mem_vol = np.array(
-            [job.memory_vol for job in self.workload_manager.pending_jobs])
-
-        job_limits = self.simulator.get_workload_limits()
-        reqes = (req_time, req_core, req_mem, req_mem_vol)
-        maxes = (job_limits['max_time'], job_limits['max_core'],
-                 job_limits['max_mem'], job_limits['max_mem_vol'])
-
-        for reqe, maxe in zip(reqes, maxes):
-            if reqe.size != 0:
-                pmin = np.min(reqe) / maxe
-                p25 = np.percentile(reqe, 25) / maxe
-                pmed = np.median(reqe) / maxe
-                p75 = np.percentile(reqe, 75) / maxe
-                pmax = np.max(reqe) / maxe
-            else:
-                pmin = p25 = pmed = p75 = pmax = 0
-
-            observation.extend([pmin, p25, pmed, p75, pmax])
-
-        if self.last_job_queue_length is None or \
-                min(len(self.workload_manager.pending_jobs), self.last_job_queue_length) == 0:
-            variation_ratio = 1.0
+                        size += sum([1 + 2 * len(processor.children) for processor in node.children])
+        return size
 
-        else:
-            variation = len(self.workload_manager.pending_jobs) - self.last_job_queue_length
-            variation_ratio = to_range(
-                variation / min(len(self.workload_manager.pending_jobs), self.last_job_queue_length)
-            )
-        observation.append(variation_ratio)
-        self.last_job_queue_length = len(self.workload_manager.pending_jobs)
-        return np.array(observation, dtype=np.float32)
+    def _small_node_observation(self) -> list:
+        observation = []
+        for cluster in self.simulator.platform.children:
+            for node in cluster.children:
+                # TODO consider normalising to node total memory
+                observation.append(node.current_memory)
+                observation.extend(normalise([max(processor.requested_memory_bandwidth,0.0) for processor in node.children]))
+        return observation
+
+    def _normal_node_observation(self) -> list:
+        observation = []
+        for cluster in self.simulator.platform.children:
+            for node in cluster.children:
+                # TODO consider normalising to node total memory
+                observation.append(node.current_memory)
+                observation.extend(normalise([max(processor.requested_memory_bandwidth,0.0) for processor in node.children]))
+                for processor in node.children:
+                    observation.append(processor.power_consumption/processor.max_power_consumption)
+                    for core in processor.children:
+                        observation.append(core.speedup)
+                        #observation.append(core.state.current_power / (core.static_power+core.dynamic_power)) # fraction of power consumption
+                        observation.append(core.get_remaining_fraction())
+        return observation
 
     def makespan_reward(self) -> float:
         return self.workload_manager.last_time - self.simulator.simulation_time
@@ -257,7 +307,9 @@ Attributes:
         return -self.simulator.platform.get_joules(delta_time)
 
     def edp_reward(self) -> float:
-        return self.energy_consumption_reward() * self.makespan_reward()
+        # Product of the energy consumption and makespan rewards, both negative
+        delta_time = self.simulator.simulation_time - self.workload_manager.last_time
+        return self.simulator.platform.get_joules(delta_time) * delta_time
 
     def slowdown_reward(self) -> float:
         return -self.simulator.slowdown_statistics()["total"]
@@ -294,6 +346,71 @@ Attributes:
                 
         return np.array(observation, dtype=np.float32)
 
+@njit(cache=True)
+def _percentiles(reqe: np.ndarray, inv_maxe: float, out: np.ndarray, offset: int):
+    """Writes the min, Q1, median, Q3 and max of reqe multiplied by inv_maxe into out[offset:offset+5].
+
+Percentiles are linearly interpolated between the closest ranks, as numpy.percentile does. reqe must
+not be empty. Long queues are partitioned around those ranks rather than fully sorted.
+    """
+    n = reqe.size
+    if n < 32:
+        ordered = np.sort(reqe)
+    else:
+        ranks = np.empty(10, dtype=np.int64)
+        for i in range(5):
+            lower = int(0.25 * i * (n - 1))
+            ranks[2 * i] = lower
+            ranks[2 * i + 1] = min(lower + 1, n - 1)
+        ordered = np.partition(reqe, ranks)
+    for i in range(5):
+        position = 0.25 * i * (n - 1)
+        lower = int(position)
+        upper = min(lower + 1, n - 1)
+        fraction = position - lower
+        out[offset+i] = (ordered[lower] + (ordered[upper] - ordered[lower]) * fraction) * inv_maxe
+
+
+@njit(cache=True)
+def _queue_variation_ratio(queue_length: int, last_queue_length: int, queue_sensitivity: float,
+                           inv_two_qs: float) -> float:
+    """Variation of the job queue length relative to the shortest of both lengths, mapped to [0, 1]."""
+    shortest = min(queue_length, last_queue_length)
+    if shortest == 0:
+        return 1.0
+    variation_ratio = ((queue_length - last_queue_length) / shortest + queue_sensitivity) * inv_two_qs
+    return min(1.0, max(0.0, variation_ratio))
+
+
+@njit(cache=True)
+def _obs_kernel(requirements: np.ndarray, inv_maxes: np.ndarray, out: np.ndarray, last_queue_length: int,
+                queue_sensitivity: float, inv_two_qs: float):
+    """Fills out with the pending job statistics followed by the queue variation ratio.
+
+requirements has one row per job requirement and one column per pending job.
+    """
+    queue_length = requirements.shape[1]
+    if queue_length == 0:
+        out[:20] = 0.0
+    else:
+        for row in range(4):
+            _percentiles(requirements[row], inv_maxes[row], out, 5 * row)
+    out[20] = _queue_variation_ratio(queue_length, last_queue_length, queue_sensitivity, inv_two_qs)
+
+
+@njit(cache=True)
+def batch_obs_kernel(stacked: np.ndarray, counts: np.ndarray, inv_maxes: np.ndarray, last_counts: np.ndarray,
+                      queue_sensitivities: np.ndarray, inv_two_qss: np.ndarray, out: np.ndarray):
+    """Fills each row of out with the job statistics of the matching environment in stacked.
+
+stacked has shape (environments, 4, max_pending) and only the first counts[e] jobs of environment e
+are valid.
+    """
+    for e in range(counts.size):
+        n = counts[e]
+        _obs_kernel(stacked[e, :, :n], inv_maxes[e], out[e], last_counts[e], queue_sensitivities[e], inv_two_qss[e])
+
+
 def normalise(l: list) -> list:
    maximum = max(l)
    if maximum == 0:
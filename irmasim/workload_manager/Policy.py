@@ -6,11 +6,12 @@ import logging
 import os.path as path
 from irmasim.workload_manager.WorkloadManager import WorkloadManager
 from irmasim.Options import Options
-from irmasim.workload_manager.Environment import Environment
+from irmasim.workload_manager.Environment import Environment, JobSelection, CoreSelection
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from irmasim.Simulator import Simulator
+    from irmasim.Job import Job
 
 
 class Policy(WorkloadManager):
@@ -23,7 +24,40 @@ class Policy(WorkloadManager):
         klass = getattr(mod, 'Core')
         self.resources = self.simulator.get_resources(klass)
         self.pending_jobs = []
+        # Submission time and requirements of the pending jobs stored as a Structure-of-Arrays in
+        # the same order as pending_jobs. The rows of pending_values are the submission time,
+        # requested time, tasks, memory and memory volume, and pending_requirements is a view of
+        # the last four. Only the first pending_count columns are valid. Values are kept in double
+        # precision so that the job selections sort by the exact job values.
+        self.pending_count = 0
+        self.pending_values = np.empty((5, 64), dtype=np.float64)
+        self.pending_requirements = self.pending_values[1:]
+        # Row of pending_values each job selection sorts by, indexed by job selection code
+        job_key_rows = {
+            # Random selection has always taken the jobs in submission order
+            JobSelection.RANDM: 0,
+            JobSelection.FIARR: 0,
+            JobSelection.SHORT: 1,
+            JobSelection.SMALL: 2,
+            JobSelection.LRMEM: 3,
+            JobSelection.LRMBW: 4
+        }
+        self.job_key_rows = tuple(job_key_rows[code] for code in JobSelection)
         self.running_jobs = []
+        # Cores ranked once for the selections whose key does not change during the simulation
+        core_rankings = {
+            CoreSelection.RANDM: self.resources,
+            CoreSelection.HICOM: sorted(self.resources, key=lambda core: - core.parent.mops_per_core),
+            CoreSelection.LPOWR: sorted(self.resources, key=lambda core: core.static_power + core.dynamic_power)
+        }
+        core_keys = {
+            CoreSelection.HICOR: lambda core: - core.parent.parent.count_idle_cores(),
+            CoreSelection.HIMEM: lambda core: - core.parent.parent.current_memory,
+            CoreSelection.HIMBW: lambda core: core.parent.requested_memory_bandwidth
+        }
+        # Indexed by core selection code
+        self.core_rankings = tuple(core_rankings.get(code) for code in CoreSelection)
+        self.core_keys = tuple(core_keys.get(code) for code in CoreSelection)
         self.load_agent = True
         self.last_reward = False
         # if objective change reset agent
@@ -87,6 +121,44 @@ class Policy(WorkloadManager):
 
     def on_job_submission(self, jobs: list):
         self.pending_jobs.extend(jobs)
+        for job in jobs:
+            self.enqueue_pending(job)
+
+    def enqueue_pending(self, job: 'Job'):
+        capacity = self.pending_values.shape[1]
+        if self.pending_count == capacity:
+            values = np.empty((5, 2 * capacity), dtype=np.float64)
+            values[:, :capacity] = self.pending_values
+            self.pending_values = values
+            self.pending_requirements = values[1:]
+        self.pending_values[:, self.pending_count] = (job.submit_time, job.req_time, job.ntasks, job.memory,
+                                                      job.memory_vol)
+        self.pending_count += 1
+
+    def dequeue_pending(self, count: int):
+        """Removes the first count pending jobs, keeping the arrays packed and in order."""
+        remaining = self.pending_count - count
+        self.pending_values[:, :remaining] = self.pending_values[:, count:self.pending_count]
+        del self.pending_jobs[:count]
+        self.pending_count = remaining
+
+    def sort_pending(self, job_code: int):
+        count = self.pending_count
+        values = self.pending_values
+        key = values[self.job_key_rows[job_code], :count]
+        if count < 2 or np.all(key[1:] >= key[:-1]):
+            return
+        order = np.argsort(key, kind='stable')
+        self.pending_jobs = [self.pending_jobs[i] for i in order]
+        values[:, :count] = values[:, order]
+
+    def available_cores(self, core_code: int):
+        ranking = self.core_rankings[core_code]
+        if ranking is not None:
+            return [core for core in ranking if core.task is None]
+        available_resources = [resource for resource in self.resources if resource.task is None]
+        available_resources.sort(key=self.core_keys[core_code])
+        return available_resources
 
     def on_job_completion(self, jobs: list):
         for job in jobs:
@@ -100,19 +172,22 @@ class Policy(WorkloadManager):
         self.apply_policy(action)
 
     def apply_policy(self, action: int):
-        key = self.environment.actions[action]
+        job_code, core_code, job_sel, core_sel = self.environment.actions[action]
         logging.getLogger("irmasim").debug("{} performing action {}-{} ({})".format( \
-                self.simulator.simulation_time, key[2], key[3], action))
-        self.pending_jobs.sort(key=key[0])
-        available_resources = [resource for resource in self.resources if resource.task is None]
-        if key[1] != None:
-            available_resources.sort(key=key[1])
-        while self.pending_jobs and len(self.pending_jobs[0].tasks) <= len(available_resources):
-            next_job = self.pending_jobs.pop(0)
+                self.simulator.simulation_time, job_sel, core_sel, action))
+        self.sort_pending(job_code)
+        available_resources = self.available_cores(core_code)
+        scheduled = 0
+        while scheduled < self.pending_count and \
+                len(self.pending_jobs[scheduled].tasks) <= len(available_resources):
+            next_job = self.pending_jobs[scheduled]
             for task in next_job.tasks:
                 task.allocate(available_resources.pop(0).full_id())
             self.simulator.schedule(next_job.tasks)
             self.running_jobs.append(next_job)
+            scheduled += 1
+        if scheduled:
+            self.dequeue_pending(scheduled)
 
     def on_end_simulation(self):
         options = Options().get()